@@ -3,23 +3,54 @@ Icarus Flask Application
 A sanctuary for human creativity
 """
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, send_from_directory
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, send_from_directory, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_caching import Cache
+from sqlalchemy import and_, case, event, func, or_, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import joinedload, load_only
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import hashlib
 import os
+import sqlite3
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config.from_object('config.Config')
 
+# User-uploaded media lives next to the app; resolved once at import time
+POSTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'posts')
+
 # Initialize extensions
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'signin'
 login_manager.login_message = 'Please sign in to access this page.'
 login_manager.login_message_category = 'info'
+cache = Cache(app)
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    """Enable WAL so SQLite readers don't block on the writer, and enforce ON DELETE CASCADE"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+# Argon2id with the OWASP minimum parameters (46 MiB, t=1, p=1)
+password_hasher = PasswordHasher(time_cost=1, memory_cost=46 * 1024, parallelism=1)
+# Only bounds how many hashes (about 46 MiB each) run at once; callers still wait on the result
+password_hash_pool = ThreadPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'], thread_name_prefix='password-hash')
 
 # ============================================================================
 # DATABASE MODELS
@@ -31,26 +62,39 @@ class User(UserMixin, db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
-    password_hash = db.Column(db.String(256), nullable=False)
+    password_hash = db.Column(db.String(512), nullable=False)
     name = db.Column(db.String(100), nullable=True)
     username = db.Column(db.String(50), unique=True, nullable=True)
     bio = db.Column(db.String(500), nullable=True)
     phone = db.Column(db.String(20), nullable=True)
     theme = db.Column(db.String(20), default='earth')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     is_active = db.Column(db.Boolean, default=True)
     
-    # Relationships
-    posts = db.relationship('Post', backref='author', lazy='dynamic')
-    likes = db.relationship('Like', backref='user', lazy='dynamic')
-    bookmarks = db.relationship('Bookmark', backref='user', lazy='dynamic')
+    # Relationships (the database cascades deletes; see the ondelete foreign keys)
+    posts = db.relationship('Post', back_populates='author', cascade='all', passive_deletes=True)
+    likes = db.relationship('Like', backref='user', cascade='all', passive_deletes=True)
+    bookmarks = db.relationship('Bookmark', backref='user', cascade='all', passive_deletes=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hash_pool.submit(password_hasher.hash, password).result()
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Legacy Werkzeug hashes are verified once and upgraded to Argon2id
+        if not self.password_hash.startswith('$argon2'):
+            if not password_hash_pool.submit(check_password_hash, self.password_hash, password).result():
+                return False
+            self.set_password(password)
+            return True
+        
+        try:
+            password_hash_pool.submit(password_hasher.verify, self.password_hash, password).result()
+        except (VerificationError, InvalidHashError):
+            return False
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def get_display_name(self):
         return self.name or self.username or self.email.split('@')[0]
@@ -100,39 +144,59 @@ class WaitlistEntry(db.Model):
         }
 
 
+# (minimum age in seconds, seconds per unit, suffix) for Post.time_ago, largest first
+TIME_AGO_UNITS = (
+    (366 * 86400, 365 * 86400, 'y'),
+    (31 * 86400, 30 * 86400, 'mo'),
+    (86400, 86400, 'd'),
+    (3601, 3600, 'h'),
+    (61, 60, 'm'),
+)
+
+
 class Post(db.Model):
     """User posts/creations"""
     __tablename__ = 'posts'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     content = db.Column(db.Text, nullable=True)
     media_type = db.Column(db.String(20), default='text')
     media_url = db.Column(db.String(500), nullable=True)
     category = db.Column(db.String(50), default='art')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    likes = db.relationship('Like', backref='post', lazy='dynamic', cascade='all, delete-orphan')
-    bookmarks = db.relationship('Bookmark', backref='post', lazy='dynamic', cascade='all, delete-orphan')
-    
-    def like_count(self):
-        return self.likes.count()
-    
-    def bookmark_count(self):
-        return self.bookmarks.count()
+    # Denormalized counters, kept in step by the like/bookmark toggle routes
+    like_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    bookmark_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    __table_args__ = (
+        db.Index('ix_posts_user_created', 'user_id', 'created_at'),
+        db.Index('ix_posts_created', 'created_at'),
+        db.Index('ix_posts_category_created', 'category', 'created_at'),
+        db.Index('ix_posts_updated', 'updated_at'),
+    )
+    
+    author = db.relationship('User', back_populates='posts')
+    likes = db.relationship('Like', backref='post', cascade='all, delete-orphan', passive_deletes=True)
+    bookmarks = db.relationship('Bookmark', backref='post', cascade='all, delete-orphan', passive_deletes=True)
     
     def is_liked_by(self, user):
         if not user or not user.is_authenticated:
             return False
-        return self.likes.filter_by(user_id=user.id).first() is not None
+        return any(like.user_id == user.id for like in self.likes)
     
     def is_bookmarked_by(self, user):
         if not user or not user.is_authenticated:
             return False
-        return self.bookmarks.filter_by(user_id=user.id).first() is not None
+        return any(bookmark.user_id == user.id for bookmark in self.bookmarks)
     
-    def to_dict(self, user=None):
+    def to_dict(self, user=None, now=None):
+        liked_ids = {self.id} if user and self.is_liked_by(user) else set()
+        bookmarked_ids = {self.id} if user and self.is_bookmarked_by(user) else set()
+        return self.to_dict_prefetched(liked_ids, bookmarked_ids, now)
+    
+    def to_dict_prefetched(self, liked_ids, bookmarked_ids, now=None):
+        """Serialize the post; liked_ids/bookmarked_ids come from get_post_stats() for whole pages"""
         return {
             'id': self.id,
             'user_id': self.user_id,
@@ -143,52 +207,142 @@ class Post(db.Model):
             'media_type': self.media_type,
             'media_url': self.media_url,
             'category': self.category,
-            'likes': self.like_count(),
-            'bookmarks': self.bookmark_count(),
-            'is_liked': self.is_liked_by(user) if user else False,
-            'is_bookmarked': self.is_bookmarked_by(user) if user else False,
+            'likes': self.like_count,
+            'bookmarks': self.bookmark_count,
+            'is_liked': self.id in liked_ids,
+            'is_bookmarked': self.id in bookmarked_ids,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'time_ago': self.time_ago()
+            'time_ago': self.time_ago(now)
         }
     
-    def time_ago(self):
-        now = datetime.utcnow()
-        diff = now - self.created_at
-        if diff.days > 365:
-            return f"{diff.days // 365}y"
-        elif diff.days > 30:
-            return f"{diff.days // 30}mo"
-        elif diff.days > 0:
-            return f"{diff.days}d"
-        elif diff.seconds > 3600:
-            return f"{diff.seconds // 3600}h"
-        elif diff.seconds > 60:
-            return f"{diff.seconds // 60}m"
-        else:
-            return "now"
+    def time_ago(self, now=None):
+        seconds = int(((now or datetime.utcnow()) - self.created_at).total_seconds())
+        for min_seconds, unit_seconds, suffix in TIME_AGO_UNITS:
+            if seconds >= min_seconds:
+                return f"{seconds // unit_seconds}{suffix}"
+        return "now"
 
 
 class Like(db.Model):
     __tablename__ = 'likes'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    __table_args__ = (db.UniqueConstraint('user_id', 'post_id'),)
+    # The unique constraint's index already covers lookups by user_id
+    __table_args__ = (db.UniqueConstraint('user_id', 'post_id'), db.Index('ix_likes_post', 'post_id'))
 
 
 class Bookmark(db.Model):
     __tablename__ = 'bookmarks'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    __table_args__ = (db.UniqueConstraint('user_id', 'post_id'),)
+    __table_args__ = (db.UniqueConstraint('user_id', 'post_id'), db.Index('ix_bookmarks_post', 'post_id'))
+
+
+class PostListVersion(db.Model):
+    """Single-row counter bumped on post and account deletes, which post_list_etag() can't otherwise see"""
+    __tablename__ = 'post_list_version'
+    id = db.Column(db.Integer, primary_key=True)
+    deletes = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
+
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def post_list_query():
+    """Post query for list views: joins in the author and loads only the columns they render"""
+    return Post.query.options(
+        joinedload(Post.author).load_only(User.id, User.name, User.username, User.email),
+        load_only(Post.id, Post.user_id, Post.content, Post.category, Post.created_at,
+                  Post.media_type, Post.media_url, Post.like_count, Post.bookmark_count)
+    )
+
+
+# Template for each themed page, built once; 'earth' is the forest look
+THEME_TEMPLATES = {
+    page: {
+        'dark': f'dark/{page}.html',
+        'light': f'light/{page}.html',
+        'earth': f'forest/{page}.html',
+        'forest': f'forest/{page}.html'
+    }
+    for page in ('feed', 'explore', 'bookmarks', 'profile')
+}
+
+
+def resolve_theme(theme):
+    """Theme from the URL if given, otherwise the user's saved theme"""
+    if theme is None:
+        theme = current_user.theme if current_user.is_authenticated else 'earth'
+    return theme
+
+
+def themed_template(page, theme):
+    templates = THEME_TEMPLATES[page]
+    return templates.get(theme, templates['forest'])
+
+
+def pick_username(base_username):
+    """First free username of base_username, base_username1, base_username2, ... (one query)"""
+    taken = {row[0] for row in db.session.query(User.username).filter(
+        User.username.startswith(base_username, autoescape=True)
+    )}
+    username = base_username
+    counter = 1
+    while username in taken:
+        username = f"{base_username}{counter}"
+        counter += 1
+    return username
+
+
+def get_post_stats(posts, user):
+    """Batch-load which of a list of posts the user has liked/bookmarked"""
+    stats = {'liked_ids': set(), 'bookmarked_ids': set()}
+    post_ids = [post.id for post in posts]
+    if post_ids and user and user.is_authenticated:
+        stats['liked_ids'] = {row[0] for row in db.session.query(Like.post_id).filter(
+            Like.user_id == user.id, Like.post_id.in_(post_ids)
+        )}
+        stats['bookmarked_ids'] = {row[0] for row in db.session.query(Bookmark.post_id).filter(
+            Bookmark.user_id == user.id, Bookmark.post_id.in_(post_ids)
+        )}
+    return stats
+
+
+def bump_post_list_version():
+    """Invalidate post_list_etag() after deleting posts; commit with the delete"""
+    updated = PostListVersion.query.filter_by(id=1).update({PostListVersion.deletes: PostListVersion.deletes + 1})
+    if not updated:
+        db.session.add(PostListVersion(id=1, deletes=1))
+
+
+def post_list_etag(*parts):
+    """ETag for post listings; changes when any post, its counters or an author profile changes, or a post is deleted"""
+    # Separate subqueries so each max() is a single index lookup rather than a table scan
+    digest = db.session.query(
+        db.session.query(func.max(Post.id)).scalar_subquery(),
+        db.session.query(func.max(Post.updated_at)).scalar_subquery(),
+        db.session.query(func.max(User.updated_at)).scalar_subquery(),
+        db.session.query(PostListVersion.deletes).filter_by(id=1).scalar_subquery()
+    ).one()
+    return hashlib.md5(repr((tuple(digest), parts)).encode()).hexdigest()
+
+
+def with_etag(response, etag):
+    """Tag a (possibly 304) response so the browser revalidates it with If-None-Match"""
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 
 # ============================================================================
@@ -213,6 +367,8 @@ def signin():
         user = User.query.filter_by(email=email).first()
         
         if user and user.check_password(password):
+            if user in db.session.dirty:
+                db.session.commit()
             login_user(user, remember=remember)
             next_page = request.args.get('next')
             flash('Welcome back!', 'success')
@@ -238,12 +394,16 @@ def waitlist():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    post_count = Post.query.filter_by(user_id=current_user.id).count()
-    art_count = Post.query.filter_by(user_id=current_user.id, category='art').count()
-    music_count = Post.query.filter_by(user_id=current_user.id, category='music').count()
-    film_count = Post.query.filter_by(user_id=current_user.id, category='film').count()
-    
-    stats = {'total': post_count, 'art': art_count, 'music': music_count, 'film': film_count}
+    category_counts = dict(db.session.query(Post.category, func.count()).filter_by(
+        user_id=current_user.id
+    ).group_by(Post.category).all())
+    
+    stats = {
+        'total': sum(category_counts.values()),
+        'art': category_counts.get('art', 0),
+        'music': category_counts.get('music', 0),
+        'film': category_counts.get('film', 0)
+    }
     recent_posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).limit(5).all()
     
     return render_template('dashboard.html', user=current_user, stats=stats, recent_posts=recent_posts)
@@ -253,27 +413,31 @@ def dashboard():
 @app.route('/feed/<theme>')
 @login_required
 def feed(theme=None):
-    if theme is None:
-        theme = current_user.theme if current_user.is_authenticated else 'earth'
+    theme = resolve_theme(theme)
 
-    posts = Post.query.order_by(Post.created_at.desc()).limit(50).all()
+    etag = post_list_etag(current_user.id, theme)
+    if session.get('_flashes'):
+        # Flashed messages are rendered into the page, so they must not be cached or skipped
+        return render_feed.uncached(current_user.id, theme, etag)
+    if request.if_none_match.contains(etag):
+        return with_etag(app.response_class(status=304), etag)
+    return with_etag(make_response(render_feed(current_user.id, theme, etag)), etag)
 
-    theme_map = {
-        'dark': 'dark/feed.html',
-        'light': 'light/feed.html',
-        'earth': 'forest/feed.html',
-        'forest': 'forest/feed.html'
-    }
 
-    template = theme_map.get(theme, 'forest/feed.html')
-    return render_template(template, user=current_user, current_theme=theme, posts=posts)
+@cache.memoize()
+def render_feed(user_id, theme, etag):
+    """Render the feed page; cached per user, theme and post_list_etag, which changes on every post, counter or profile write"""
+    posts = post_list_query().order_by(Post.created_at.desc()).limit(50).all()
+
+    template = themed_template('feed', theme)
+    return render_template(template, user=current_user, current_theme=theme, posts=posts, **get_post_stats(posts, current_user))
 
 
 @app.route('/settings')
 @login_required
 def settings():
     # Redirect to feed with settings modal auto-open parameter
-    theme = current_user.theme if current_user.is_authenticated else 'earth'
+    theme = resolve_theme(None)
     return redirect(url_for('feed', theme=theme, open_settings='true'))
 
 
@@ -281,62 +445,42 @@ def settings():
 @app.route('/explore/<theme>')
 @login_required
 def explore(theme=None):
-    if theme is None:
-        theme = current_user.theme if current_user.is_authenticated else 'earth'
-
-    posts = Post.query.order_by(Post.created_at.desc()).limit(50).all()
+    theme = resolve_theme(theme)
 
-    theme_map = {
-        'dark': 'dark/explore.html',
-        'light': 'light/explore.html',
-        'earth': 'forest/explore.html',
-        'forest': 'forest/explore.html'
-    }
+    posts = post_list_query().order_by(Post.created_at.desc()).limit(50).all()
 
-    template = theme_map.get(theme, 'forest/explore.html')
-    return render_template(template, user=current_user, current_theme=theme, posts=posts)
+    template = themed_template('explore', theme)
+    return render_template(template, user=current_user, current_theme=theme, posts=posts, **get_post_stats(posts, current_user))
 
 
 @app.route('/bookmarks')
 @app.route('/bookmarks/<theme>')
 @login_required
 def bookmarks_page(theme=None):
-    if theme is None:
-        theme = current_user.theme if current_user.is_authenticated else 'earth'
+    theme = resolve_theme(theme)
 
-    bookmarked_posts = Post.query.join(Bookmark).filter(
+    bookmarked_posts = post_list_query().join(Bookmark).filter(
         Bookmark.user_id == current_user.id
     ).order_by(Bookmark.created_at.desc()).all()
 
-    theme_map = {
-        'dark': 'dark/bookmarks.html',
-        'light': 'light/bookmarks.html',
-        'earth': 'forest/bookmarks.html',
-        'forest': 'forest/bookmarks.html'
-    }
-    template = theme_map.get(theme, 'forest/bookmarks.html')
+    template = themed_template('bookmarks', theme)
 
-    return render_template(template, user=current_user, current_theme=theme, posts=bookmarked_posts, page_title='Bookmarks')
+    return render_template(template, user=current_user, current_theme=theme, posts=bookmarked_posts, page_title='Bookmarks',
+                           **get_post_stats(bookmarked_posts, current_user))
 
 
 @app.route('/profile')
 @app.route('/profile/<theme>')
 @login_required
 def profile(theme=None):
-    if theme is None:
-        theme = current_user.theme if current_user.is_authenticated else 'earth'
+    theme = resolve_theme(theme)
 
-    posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).all()
+    posts = post_list_query().filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).all()
 
-    theme_map = {
-        'dark': 'dark/profile.html',
-        'light': 'light/profile.html',
-        'earth': 'forest/profile.html',
-        'forest': 'forest/profile.html'
-    }
-    template = theme_map.get(theme, 'forest/profile.html')
+    template = themed_template('profile', theme)
 
-    return render_template(template, user=current_user, current_theme=theme, posts=posts, page_title=f"{current_user.get_display_name()}'s Profile")
+    return render_template(template, user=current_user, current_theme=theme, posts=posts, page_title=f"{current_user.get_display_name()}'s Profile",
+                           **get_post_stats(posts, current_user))
 
 
 @app.route('/logout')
@@ -369,27 +513,27 @@ def api_signup():
     if len(password) < 8:
         return jsonify({'success': False, 'error': 'Password must be at least 8 characters'}), 400
     
-    if User.query.filter_by(email=email).first():
-        return jsonify({'success': False, 'error': 'Email already registered'}), 409
-    
-    base_username = email.split('@')[0].lower()
-    username = base_username
-    counter = 1
-    while User.query.filter_by(username=username).first():
-        username = f"{base_username}{counter}"
-        counter += 1
-    
-    user = User(email=email, name=name if name else None, username=username, phone=phone if phone else None, theme=theme)
+    user = User(email=email, name=name if name else None, phone=phone if phone else None, theme=theme)
     user.set_password(password)
     
-    try:
-        db.session.add(user)
-        db.session.commit()
-        login_user(user)
-        return jsonify({'success': True, 'message': 'Account created successfully', 'user': user.to_dict(), 'redirect': url_for('feed')}), 201
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'success': False, 'error': 'Database error'}), 500
+    # The unique indexes reject duplicates; a username clash just means a concurrent
+    # signup took the same suffix, so pick again
+    for _ in range(3):
+        user.username = pick_username(email.split('@')[0].lower())
+        try:
+            db.session.add(user)
+            db.session.commit()
+            login_user(user)
+            return jsonify({'success': True, 'message': 'Account created successfully', 'user': user.to_dict(), 'redirect': url_for('feed')}), 201
+        except IntegrityError:
+            db.session.rollback()
+            if db.session.query(User.id).filter_by(email=email).first():
+                return jsonify({'success': False, 'error': 'Email already registered'}), 409
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'Database error'}), 500
+    
+    return jsonify({'success': False, 'error': 'Database error'}), 500
 
 
 @app.route('/api/signin', methods=['POST'])
@@ -405,6 +549,8 @@ def api_signin():
     user = User.query.filter_by(email=email).first()
     
     if user and user.check_password(password):
+        if user in db.session.dirty:
+            db.session.commit()
         login_user(user, remember=remember)
         return jsonify({'success': True, 'message': 'Signed in successfully', 'user': user.to_dict(), 'redirect': url_for('feed')}), 200
     else:
@@ -425,16 +571,15 @@ def waitlist_submit():
     if not email:
         return jsonify({'success': False, 'error': 'Email is required'}), 400
     
-    existing = WaitlistEntry.query.filter_by(email=email).first()
-    if existing:
-        return jsonify({'success': True, 'message': 'You\'re already on the waitlist!'}), 200
-    
     entry = WaitlistEntry(email=email, name=name if name else None, role=role if role else None, source=source)
     
     try:
         db.session.add(entry)
         db.session.commit()
         return jsonify({'success': True, 'message': 'Successfully joined the waitlist', 'entry': entry.to_dict()}), 201
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': True, 'message': 'You\'re already on the waitlist!'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': 'Database error'}), 500
@@ -453,16 +598,17 @@ def update_profile():
     if not data:
         return jsonify({'success': False, 'error': 'No data provided'}), 400
     
+    # Uniqueness is enforced by the database; these are the errors to report if it objects
+    conflict_errors = []
+    
     if 'name' in data:
         current_user.name = data['name'].strip() if data['name'] else None
     
     if 'username' in data:
         new_username = data['username'].strip().lower()
-        if new_username:
-            existing = User.query.filter(User.username == new_username, User.id != current_user.id).first()
-            if existing:
-                return jsonify({'success': False, 'error': 'Username already taken'}), 409
+        if new_username and new_username != current_user.username:
             current_user.username = new_username
+            conflict_errors.append('Username already taken')
     
     if 'bio' in data:
         current_user.bio = data['bio'].strip() if data['bio'] else None
@@ -470,14 +616,16 @@ def update_profile():
     if 'email' in data:
         new_email = data['email'].strip().lower()
         if new_email and new_email != current_user.email:
-            existing = User.query.filter(User.email == new_email, User.id != current_user.id).first()
-            if existing:
-                return jsonify({'success': False, 'error': 'Email already in use'}), 409
             current_user.email = new_email
+            conflict_errors.append('Email already in use')
     
     try:
         db.session.commit()
         return jsonify({'success': True, 'message': 'Profile updated successfully', 'user': current_user.to_dict()})
+    except IntegrityError:
+        db.session.rollback()
+        error = conflict_errors[0] if len(conflict_errors) == 1 else 'Username or email already in use'
+        return jsonify({'success': False, 'error': error}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': 'Database error'}), 500
@@ -528,22 +676,41 @@ def update_theme():
 @login_required
 def get_posts():
     category = request.args.get('category', None)
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
+    cursor = request.args.get('cursor', None)
+    per_page = max(request.args.get('per_page', 20, type=int), 1)
+    
+    etag = post_list_etag(current_user.id, request.full_path)
+    if request.if_none_match.contains(etag):
+        return with_etag(app.response_class(status=304), etag)
     
-    query = Post.query
+    query = post_list_query()
     if category:
         query = query.filter_by(category=category)
     
-    posts = query.order_by(Post.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    
-    return jsonify({
+    # Keyset pagination: the cursor is the (created_at, id) of the last post already sent
+    if cursor:
+        try:
+            cursor_time, cursor_id = cursor.rsplit('_', 1)
+            cursor_time, cursor_id = datetime.fromisoformat(cursor_time), int(cursor_id)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+        query = query.filter(or_(
+            Post.created_at < cursor_time,
+            and_(Post.created_at == cursor_time, Post.id < cursor_id)
+        ))
+    
+    posts = query.order_by(Post.created_at.desc(), Post.id.desc()).limit(per_page + 1).all()
+    has_more = len(posts) > per_page
+    posts = posts[:per_page]
+    stats = get_post_stats(posts, current_user)
+    now = datetime.utcnow()
+    
+    return with_etag(jsonify({
         'success': True,
-        'posts': [post.to_dict(current_user) for post in posts.items],
-        'total': posts.total,
-        'pages': posts.pages,
-        'current_page': page
-    })
+        'posts': [post.to_dict_prefetched(**stats, now=now) for post in posts],
+        'has_more': has_more,
+        'next_cursor': f"{posts[-1].created_at.isoformat()}_{posts[-1].id}" if has_more else None
+    }), etag)
 
 
 @app.route('/api/posts', methods=['POST'])
@@ -585,6 +752,7 @@ def delete_post(post_id):
     
     try:
         db.session.delete(post)
+        bump_post_list_version()
         db.session.commit()
         return jsonify({'success': True, 'message': 'Post deleted successfully'})
     except Exception as e:
@@ -596,18 +764,21 @@ def delete_post(post_id):
 @login_required
 def toggle_like(post_id):
     post = Post.query.get_or_404(post_id)
-    existing_like = Like.query.filter_by(user_id=current_user.id, post_id=post_id).first()
     
     try:
-        if existing_like:
-            db.session.delete(existing_like)
+        # Only the request whose DELETE actually removed the row decrements,
+        # so two racing un-likes can't take the count down twice
+        deleted = Like.query.filter_by(user_id=current_user.id, post_id=post_id).delete()
+        if deleted:
+            Post.query.filter_by(id=post_id).update({Post.like_count: Post.like_count - 1})
             db.session.commit()
-            return jsonify({'success': True, 'liked': False, 'likes': post.like_count()})
+            return jsonify({'success': True, 'liked': False, 'likes': post.like_count})
         else:
             like = Like(user_id=current_user.id, post_id=post_id)
             db.session.add(like)
+            Post.query.filter_by(id=post_id).update({Post.like_count: Post.like_count + 1})
             db.session.commit()
-            return jsonify({'success': True, 'liked': True, 'likes': post.like_count()})
+            return jsonify({'success': True, 'liked': True, 'likes': post.like_count})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': 'Database error'}), 500
@@ -617,18 +788,21 @@ def toggle_like(post_id):
 @login_required
 def toggle_bookmark(post_id):
     post = Post.query.get_or_404(post_id)
-    existing_bookmark = Bookmark.query.filter_by(user_id=current_user.id, post_id=post_id).first()
     
     try:
-        if existing_bookmark:
-            db.session.delete(existing_bookmark)
+        # Only the request whose DELETE actually removed the row decrements,
+        # so two racing un-bookmarks can't take the count down twice
+        deleted = Bookmark.query.filter_by(user_id=current_user.id, post_id=post_id).delete()
+        if deleted:
+            Post.query.filter_by(id=post_id).update({Post.bookmark_count: Post.bookmark_count - 1})
             db.session.commit()
-            return jsonify({'success': True, 'bookmarked': False, 'bookmarks': post.bookmark_count()})
+            return jsonify({'success': True, 'bookmarked': False, 'bookmarks': post.bookmark_count})
         else:
             bookmark = Bookmark(user_id=current_user.id, post_id=post_id)
             db.session.add(bookmark)
+            Post.query.filter_by(id=post_id).update({Post.bookmark_count: Post.bookmark_count + 1})
             db.session.commit()
-            return jsonify({'success': True, 'bookmarked': True, 'bookmarks': post.bookmark_count()})
+            return jsonify({'success': True, 'bookmarked': True, 'bookmarks': post.bookmark_count})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': 'Database error'}), 500
@@ -637,15 +811,22 @@ def toggle_bookmark(post_id):
 @app.route('/api/waitlist', methods=['GET'])
 @login_required
 def get_waitlist():
+    digest = db.session.query(
+        func.count(WaitlistEntry.id), func.max(WaitlistEntry.id),
+        func.sum(case((WaitlistEntry.notified, 1), else_=0))
+    ).one()
+    etag = hashlib.md5(repr(tuple(digest)).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        return with_etag(app.response_class(status=304), etag)
+    
     entries = WaitlistEntry.query.order_by(WaitlistEntry.created_at.desc()).all()
-    return jsonify({'success': True, 'count': len(entries), 'entries': [entry.to_dict() for entry in entries]})
+    return with_etag(jsonify({'success': True, 'count': len(entries), 'entries': [entry.to_dict() for entry in entries]}), etag)
 
 
 @app.route('/posts/<path:subpath>/<filename>')
 def serve_post_media(subpath, filename):
-    """Serve media files from the posts directory"""
-    posts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'posts')
-    return send_from_directory(os.path.join(posts_dir, subpath), filename)
+    """Serve media files from the posts directory (in production, let nginx serve /posts/)"""
+    return send_from_directory(POSTS_DIR, f"{subpath}/{filename}", max_age=86400, conditional=True)
 
 
 @app.route('/api/user/delete', methods=['DELETE'])
@@ -658,10 +839,14 @@ def delete_account():
         return jsonify({'success': False, 'error': 'Incorrect password'}), 401
     
     try:
-        Post.query.filter_by(user_id=current_user.id).delete()
-        Like.query.filter_by(user_id=current_user.id).delete()
-        Bookmark.query.filter_by(user_id=current_user.id).delete()
+        # Take this user's likes/bookmarks back out of the counters on other posts
+        Post.query.filter(Post.id.in_(db.session.query(Like.post_id).filter_by(user_id=current_user.id))).update(
+            {Post.like_count: Post.like_count - 1}, synchronize_session=False)
+        Post.query.filter(Post.id.in_(db.session.query(Bookmark.post_id).filter_by(user_id=current_user.id))).update(
+            {Post.bookmark_count: Post.bookmark_count - 1}, synchronize_session=False)
+        # Posts, likes and bookmarks go with the user via ON DELETE CASCADE
         db.session.delete(current_user)
+        bump_post_list_version()
         db.session.commit()
         logout_user()
         return jsonify({'success': True, 'message': 'Account deleted successfully', 'redirect': url_for('index')})
@@ -688,9 +873,24 @@ def server_error(e):
     return render_template('500.html'), 500
 
 
-@app.context_processor
-def inject_user():
-    return dict(current_user=current_user)
+def rebuild_sqlite_table(conn, table):
+    """Recreate a SQLite table from its current model definition, keeping its rows whose parents still exist"""
+    old_columns = {column['name'] for column in db.inspect(conn).get_columns(table.name)}
+    columns = ', '.join(column.name for column in table.columns if column.name in old_columns)
+    create_sql = str(CreateTable(table).compile(conn)).replace(
+        f'CREATE TABLE {table.name} ', f'CREATE TABLE _new_{table.name} ', 1)
+    
+    for index in db.inspect(conn).get_indexes(table.name):
+        conn.exec_driver_sql(f'DROP INDEX {index["name"]}')
+    conn.exec_driver_sql(create_sql)
+    # Foreign keys were never enforced on older databases, so leave behind rows pointing at deleted parents
+    parents_exist = ' AND '.join(
+        f'{fk.parent.name} IN (SELECT {fk.column.name} FROM {fk.column.table.name})' for fk in table.foreign_keys
+    ) or '1'
+    conn.exec_driver_sql(
+        f'INSERT INTO _new_{table.name} ({columns}) SELECT {columns} FROM {table.name} WHERE {parents_exist}')
+    conn.exec_driver_sql(f'DROP TABLE {table.name}')
+    conn.exec_driver_sql(f'ALTER TABLE _new_{table.name} RENAME TO {table.name}')
 
 
 def init_db():
@@ -705,6 +905,42 @@ def init_db():
                 pass
                 
         db.create_all()
+        
+        recount_posts = text(
+            'UPDATE posts SET '
+            'like_count = (SELECT count(*) FROM likes WHERE likes.post_id = posts.id), '
+            'bookmark_count = (SELECT count(*) FROM bookmarks WHERE bookmarks.post_id = posts.id)'
+        )
+        
+        # Older databases predate the denormalized counters on posts; add and backfill them once
+        post_columns = {column['name'] for column in db.inspect(db.engine).get_columns('posts')}
+        if 'like_count' not in post_columns:
+            with db.engine.begin() as conn:
+                conn.execute(text('ALTER TABLE posts ADD COLUMN like_count INTEGER NOT NULL DEFAULT 0'))
+                conn.execute(text('ALTER TABLE posts ADD COLUMN bookmark_count INTEGER NOT NULL DEFAULT 0'))
+                conn.execute(recount_posts)
+        
+        # SQLite can't alter constraints, so rebuild tables created before ON DELETE CASCADE
+        if db.engine.dialect.name == 'sqlite':
+            inspector = db.inspect(db.engine)
+            stale_tables = [
+                table for table in (Post.__table__, Like.__table__, Bookmark.__table__)
+                if any(fk['options'].get('ondelete') != 'CASCADE' for fk in inspector.get_foreign_keys(table.name))
+            ]
+            if stale_tables:
+                with db.engine.connect() as conn:
+                    conn.exec_driver_sql('PRAGMA foreign_keys=OFF')
+                    for table in stale_tables:
+                        rebuild_sqlite_table(conn, table)
+                    # Dropped orphan likes/bookmarks may have been counted on posts that remain
+                    conn.execute(recount_posts)
+                    conn.commit()
+                    conn.exec_driver_sql('PRAGMA foreign_keys=ON')
+        
+        # create_all() skips existing tables, so add any indexes declared since
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=db.engine, checkfirst=True)
         print("Database initialized successfully!")
 
 
@@ -21,6 +21,24 @@ class Config:
         'sqlite:///' + os.path.join(basedir, 'instance', 'icarus.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool (sized for a handful of gunicorn workers)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        # Pooled SQLite connections are shared across request threads
+        SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {'check_same_thread': False}
+    
+    # Rendered feed cache (use RedisCache in production so invalidation reaches every worker)
+    CACHE_TYPE = 'SimpleCache'
+    CACHE_DEFAULT_TIMEOUT = 30
+    
+    # Maximum concurrent password hashes per process (Argon2id uses 46 MiB each)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+    
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
@@ -56,7 +74,9 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # in-memory SQLite uses a static pool
     WTF_CSRF_ENABLED = False
+    CACHE_TYPE = 'NullCache'
 
 
 # Configuration dictionary